@@ -4,7 +4,10 @@ https://github.com/COMCIFS/instrument-geometry-info/blob/main/Tools/dials_expt_t
 Orignal author: Dr. James Hester, ANSTO, Lucas Heights, Australia 
 """
 
+import functools
+import io
 import json
+import logging
 import math
 import os
 import re
@@ -13,17 +16,33 @@ from argparse import ArgumentParser
 from pathlib import Path
 
 import numpy as np
-from scipy.spatial.transform import Rotation as R
+
+try:
+    # orjson parses large .expt files several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
 
 GONIO_DEFAULT_AXIS = 'Omega'  # Used when goniometer has 1 nameless axis
 
 #=== Utilities ===
 # will go into an external library source-file later
 
+logger = logging.getLogger('dials2imgcif')
+
 def debug(label, object):
-    """Simple object content exposure as debug info
+    """Simple object content exposure as debug info. The message is only
+       formatted when debug output is enabled (option --debug).
+    """
+    logger.debug('%s: %s', label, object)
+
+
+def _cross3_batch(a, b):
+    """Row-wise cross product of two (n, 3) arrays
     """
-    print(f'DEBUG - {label}: {object}')
+    return np.stack((a[:, 1]*b[:, 2] - a[:, 2]*b[:, 1],
+                     a[:, 2]*b[:, 0] - a[:, 0]*b[:, 2],
+                     a[:, 0]*b[:, 1] - a[:, 1]*b[:, 0]), axis=1)
 
 
 def sanity_check(js_info):
@@ -34,31 +53,44 @@ def sanity_check(js_info):
     
     d_info = js_info['detector']
 
-    panel_count = [len(x['panels']) for x in d_info]
-    #debug('Panel numbers across detector entries', pc)
-    assert len(set(panel_count)) == 1
-
-    # Assume if names are the same, it is the same panel
+    # Assume if names are the same, it is the same panel. Comparing the
+    # ordered panel names covers the panel count as well.
 
-    for i in range(panel_count[0]):
-        panel_names = [x['panels'][i]['name'] for x in d_info]
-        assert len(set(panel_names)) == 1
+    panel_sigs = {tuple(p['name'] for p in x['panels']) for x in d_info}
+    #debug('Panel signatures across detector entries', panel_sigs)
+    assert len(panel_sigs) == 1
 
 
 #=== Raw input parsing from JSON ===
 
+def _loads(content):
+    """ Parse JSON <content> (bytes), with orjson when available. orjson
+        rejects NaN and Infinity, which json.dump writes by default, so such
+        files are parsed again with json.
+    """
+
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(content)
+
+
 def extract_raw_info(filename):
 
     if not os.path.exists(filename):
         print(f'Could not open input file "{filename}": Aborting!')
         sys.exit()
 
-    with open(filename, 'r') as f:
+    with open(filename, 'rb') as f:
         try:
-            expt_dict = json.load(f)
+            expt_dict = _loads(f.read())
             sanity_check(expt_dict)
-        except json.decoder.JSONDecodeError:
+        except json.JSONDecodeError:
             print('Could not recognize/decode/interpret JSON format.')
+            sys.exit()
 
     return expt_dict
 
@@ -75,8 +107,13 @@ def get_beam_info(expt):
 
 def get_axes_info(expt):
     gon_axes = get_gon_axes(expt)
-    det_axes = get_det_axes(expt)
-    srf_axes = get_srf_axes(expt)
+    # the panel geometry of every detector position and the two theta derived
+    # from it are needed for both detector and surface axes, so they are
+    # worked out once per conversion and passed on
+    geoms = [_panel_geometry(det) for det in expt['detector']]
+    tth_info = get_two_thetas(geoms)
+    det_axes = get_det_axes(expt, tth_info, geoms)
+    srf_axes = get_srf_axes(expt, tth_info[0], geoms[0])
     
     return gon_axes, det_axes, srf_axes
 
@@ -101,10 +138,12 @@ def get_gon_axes(expt):
         
     else:
         n_axes = len(g_dict['names'])
+        # angle settings of all goniometer entries, shape (n_entries, n_axes)
+        angles = np.asarray([x['angles'] for x in g_info])
         for i in range(n_axes):
             axis_dict[g_dict['names'][i]] = {
                 'axis': g_dict['axes'][i],
-                'vals': [x['angles'][i] for x in g_info],
+                'vals': angles[:, i].tolist(),
                 'next': '.' if i == (n_axes-1) else f'{g_dict["names"][i+1]}'
             }
     debug('axes in processed dict', axis_dict)
@@ -112,7 +151,36 @@ def get_gon_axes(expt):
     return axis_dict
 
 
-def get_det_axes(expt):
+def get_two_thetas(geoms):
+    """ Calculate the rotation required to make the normal to the module
+        parallel to the beam, for each detector position at once. This
+        assumes that the panel used is perpendicular to the beam at tth = 0.
+        <geoms> holds the panel geometry of each entry under key 'detector',
+        as returned by <def _panel_geometry>.
+        Returns: list of (angle, axis), with axis None when tth = 0
+    """
+
+    pp = geoms[0][4]
+    if pp is None:
+        raise AssertionError('Unable to find a panel perpendicular to the beam at tth = 0')
+
+    # the panels are the same in every entry (see sanity_check)
+    p_onrm = np.array([geom[3][pp] for geom in geoms])
+    #debug('Normal to surface', p_onrm)
+
+    p_onrm[p_onrm[:, 2] > 0] *= -1.0  # pointing towards sample
+    at_zero = np.linalg.norm(p_onrm - [0, 0, -1], axis=1) < 0.0001
+
+    # axis and angle of the rotation taking each normal onto [0,0,-1]
+    rot_vecs = _cross3_batch(p_onrm, np.broadcast_to([0.0, 0.0, -1.0], p_onrm.shape))
+    sin_angl = np.linalg.norm(rot_vecs, axis=1)
+    tth_angl = np.degrees(np.arctan2(sin_angl, -p_onrm[:, 2]))
+
+    return [(0.0, None) if zero else (float(angl), rot_vec / sin)
+            for zero, angl, rot_vec, sin in zip(at_zero, tth_angl, rot_vecs, sin_angl)]
+
+
+def get_det_axes(expt, axis_info, geoms):
     """Determine the axes that move the detector.
        For axes describing pixel positions, see <def surface_axes>.
 
@@ -125,22 +193,16 @@ def get_det_axes(expt):
        with the same names.
 
        For two theta and distance, we find the corresponding (virtual) panel
-       that is orthonormal to the beam
+       that is orthonormal to the beam. <axis_info> holds the two theta of
+       each detector position, as returned by <def get_two_thetas>, and
+       <geoms> the panel geometry of each position (<def _panel_geometry>).
     """
 
-    d_info = expt['detector']
-
-    # Sanity check 
     #panels = d_info[0]['panels']   # Not used anymore?
-    pp = find_perp_panel(d_info[0])
-    if pp is None:
-        raise AssertionError('Unable to find a panel perpendicular to the beam at tth = 0')
+    pp = geoms[0][4]
 
     axis_dict = {}
 
-    # two theta for each detector position
-    axis_info = [get_two_theta(det) for det in d_info]
-
     # Only a non-zero tth will give us the axis direction, else no tth required
     poss_axes = [x for x in axis_info if x[1] is not None]
     debug('Possible axes:', poss_axes)
@@ -153,7 +215,7 @@ def get_det_axes(expt):
             'type': 'rotation'
         }
     
-    dists = [get_distance(x['panels'][pp]) for x in d_info]
+    dists = get_distances(geoms, pp)
 
     axis_dict['Trans'] = {
         'axis': [0, 0, -1],
@@ -164,41 +226,60 @@ def get_det_axes(expt):
     return axis_dict
 
 
-def get_two_theta(detector):
-    """ Calculate the rotation required to make the normal to the module
-        parallel to the beam. This assumes that the panel provided is
-        perpendicular to the beam at tth = 0.
-        <detector> is a single entry i.e. list element under key 'detector'.
+def _panel_vectors(detector):
+    """ Stack the fast axis, slow axis and origin of all panels of a single
+        detector entry, so that they are read from the JSON only once.
+        Returns: three arrays of shape (n_panels, 3)
     """
 
-    pp = find_perp_panel(detector)
+    stack = np.array([[p['fast_axis'], p['slow_axis'], p['origin']]
+                      for p in detector['panels']], dtype=float)
 
-    panel = detector['panels'][pp]
-    p_orth = np.cross(panel['fast_axis'], panel['slow_axis'])
-    p_onrm = p_orth / np.linalg.norm(p_orth)
-    #debug('Normal to surface', p_onrm)
+    return stack[:, 0], stack[:, 1], stack[:, 2]
 
-    if p_onrm[2] > 0: #pointing towards sample
-        p_onrm *= -1.0
 
-    if np.linalg.norm(p_onrm - [0,0,-1]) < 0.0001:
-        return 0.0, None
+def _panel_geometry(detector):
+    """ Panel vectors, unit normals and the index of the panel perpendicular
+        to the beam at tth = 0 for a single detector entry. These only depend
+        on the entry; <def get_axes_info> computes them once per conversion
+        and passes them to the helpers that need them.
+        Returns: (fast, slow, origin, normals, perp_idx)
+    """
 
-    rot_obj = R.align_vectors(np.array([0,0,-1]), p_onrm)
-    rot_vec = rot_obj[0].as_rotvec(degrees=True)
-    tth_angl = np.linalg.norm(rot_vec)
-    tth_axis = rot_vec / tth_angl
+    fast, slow, origin = _panel_vectors(detector)
+    p_orth = _cross3_batch(fast, slow)
+    normals = p_orth / np.linalg.norm(p_orth, axis=1, keepdims=True)
 
-    return tth_angl, tth_axis
+    # can be rotated about X to zero
+    is_perp = np.isclose(normals[:, 0], 0.0, rtol=0.0, atol=0.0001)
+    perp_idx = int(is_perp.argmax()) if is_perp.any() else None
 
+    return fast, slow, origin, normals, perp_idx
 
-def get_distance(panel):
+
+def _rotation_matrix(axis, angle):
+    """ Rotation matrix for a rotation of <angle> degrees about the unit
+        vector <axis>, using Rodrigues' formula
+    """
+
+    k = np.array([[0.0, -axis[2], axis[1]],
+                  [axis[2], 0.0, -axis[0]],
+                  [-axis[1], axis[0], 0.0]])
+    angle = math.radians(angle)
+
+    return np.eye(3) + math.sin(angle) * k + (1.0 - math.cos(angle)) * (k @ k)
+
+
+def get_distances(geoms, pp):
+    """ Distance of panel <pp> from the sample for every detector entry,
+        given the panel geometry <geoms> of the entries.
+    """
 
     # Get projection of a pixel vector onto the normal to the panel
 
-    p_orth = np.cross(panel['fast_axis'], panel['slow_axis'])
-    p_onrm = p_orth / np.linalg.norm(p_orth)
-    return abs(np.dot(panel['origin'], p_onrm))
+    origins = np.array([g[2][pp] for g in geoms])
+    normals = np.array([g[3][pp] for g in geoms])
+    return np.abs(np.einsum('ij,ij->i', origins, normals)).tolist()
 
 
 def find_perp_panel(d_info):
@@ -206,55 +287,47 @@ def find_perp_panel(d_info):
         Returns: the index of the first panel the meets the requirement
     """
 
-    for i, p in enumerate(d_info['panels']):
-        p_orth = np.cross(p['fast_axis'], p['slow_axis'])
-        p_onrm = p_orth / np.linalg.norm(p_orth)
+    return _panel_geometry(d_info)[4]
 
-        if math.isclose(p_onrm[0], 0.0, abs_tol=0.0001):
-            # can be rotated about X to zero
-            return i
 
-    return None
-
-
-def get_srf_axes(expt):
-    """ Return the axis directions of each panel when tth = 0
+def get_srf_axes(expt, tth_info, geom):
+    """ Return the axis directions of each panel when tth = 0.
+        <tth_info> is the two theta (angle, axis) and <geom> the panel
+        geometry (<def _panel_geometry>) of the first detector position.
     """
     
     d_info = expt['detector'][0]
+    fast, slow, origin, _, _ = geom
+    pixel_sizes = np.array([p['pixel_size'] for p in d_info['panels']])
+    image_sizes = np.array([p['image_size'] for p in d_info['panels']])
 
     axis_dict = {}
     
-    tth_angl, tth_axis = get_two_theta(d_info)
-    for i, panel in enumerate(d_info['panels'], start=1):
-        fast = panel['fast_axis']
-        slow = panel['slow_axis']
-        origin = panel['origin']
-        
-        if tth_axis is not None:
-            # rotation matrix from 2theta angle-axis (reverse angle)
-            rot_vec = tth_angl * tth_axis  # exp. result in separate test, but may need *-1
-            rot_mat = R.from_rotvec(rot_vec, degrees=True).as_matrix()
-            # apply to (rotated) detector base axes in order to 'unrotate'
-            fast = np.around(np.dot(rot_mat, fast), decimals=3)
-            slow = np.around(np.dot(rot_mat, slow), decimals=3)
-            origin = np.around(np.dot(rot_mat, origin), decimals=3)
-
-        origin = [origin[0], origin[1], 0.0]   # z component is distance
-        
-        axis_dict[f'ele{i}_x'] = { 'axis': fast,
+    tth_angl, tth_axis = tth_info
+    if tth_axis is not None:
+        # rotation matrix from 2theta angle-axis (reverse angle)
+        rot_mat = _rotation_matrix(tth_axis, tth_angl)  # exp. result in separate test, but may need *-1
+        # apply to (rotated) detector base axes of all panels in order to
+        # 'unrotate', stacked so that it is one product for all vectors
+        # (adding 0.0 turns any -0.0 left by the rounding into 0.0)
+        stacked = np.concatenate((fast, slow, origin)) @ rot_mat.T
+        fast, slow, origin = np.split(np.around(stacked, decimals=3) + 0.0, 3)
+
+    for i in range(1, len(fast) + 1):
+        axis_dict[f'ele{i}_x'] = { 'axis': fast[i-1],
                                    'next': "Trans",
-                                   'origin': origin,
-                                   'pix_size': panel['pixel_size'][0],
-                                   'num_pix': panel['image_size'][0],
+                                   # z component is distance
+                                   'origin': [origin[i-1, 0], origin[i-1, 1], 0.0],
+                                   'pix_size': pixel_sizes[i-1, 0],
+                                   'num_pix': image_sizes[i-1, 0],
                                    'prec': 1,
                                    'element': i
         }
-        axis_dict[f'ele{i}_y'] = { 'axis': slow,
+        axis_dict[f'ele{i}_y'] = { 'axis': slow[i-1],
                                    'next': f'ele{i}_x',
                                    'origin': [0.0, 0.0, 0.0],
-                                   'pix_size': panel['pixel_size'][1],
-                                   'num_pix': panel['image_size'][1],
+                                   'pix_size': pixel_sizes[i-1, 1],
+                                   'num_pix': image_sizes[i-1, 1],
                                    'prec': 2,
                                    'element': i
         }
@@ -280,6 +353,10 @@ def get_scan_info(expt):
     """
     scan_list = []
 
+    goniometers = expt['goniometer']
+    scans = expt['scan']
+    imagesets = expt['imageset']
+
     for s_ix, e_block in enumerate(expt['experiment']):
 
         scan_id = f'SCAN0{s_ix+1}'
@@ -287,7 +364,8 @@ def get_scan_info(expt):
 
         scan_info = {}
 
-        gonio = expt['goniometer'][e_block['goniometer']] # gonio info that the index in scan info points to
+        gonio_idx = e_block['goniometer']
+        gonio = goniometers[gonio_idx] # gonio info that the index in scan info points to
         if 'names' in gonio:
             scan_ax = gonio['names'][gonio['scan_axis']]
         else:
@@ -295,10 +373,10 @@ def get_scan_info(expt):
 
         # get scan information
 
-        s_block = expt['scan'][e_block['scan']]
-        start = s_block['oscillation'][0]
-        step = s_block['oscillation'][1]
-        num_frames = len(s_block['exposure_time'])
+        s_block = scans[e_block['scan']]
+        start, step = s_block['oscillation'][:2]
+        exposure_times = s_block['exposure_time']
+        num_frames = len(exposure_times)
         full_range = step * num_frames # to end of final step
 
         # Store
@@ -307,11 +385,11 @@ def get_scan_info(expt):
         scan_info['start'] = start
         scan_info['step'] = step
         scan_info['range'] = full_range
-        scan_info['gonio_idx'] = e_block['goniometer']
+        scan_info['gonio_idx'] = gonio_idx
         scan_info['det_idx'] = e_block['detector']
         scan_info['num_frames'] = num_frames
-        scan_info['integration_time'] = s_block['exposure_time']
-        scan_info['images'] = expt['imageset'][e_block['imageset']]['template']
+        scan_info['integration_time'] = exposure_times
+        scan_info['images'] = imagesets[e_block['imageset']]['template']
 
         scan_list.append(scan_info)
     
@@ -376,69 +454,98 @@ def find_filename(full_name, cutspec):
     return full_name
 
 
-def determine_arch_type(arch_name):
+# file name endings for each imgCIF archive and image format
+ARCH_SUFFIXES = {
+    'TGZ': ('.tgz', '.tar.gz'),
+    'TBZ': ('.tbz', '.tar.bz2'),
+    'ZIP': ('.zip',),
+    'TXZ': ('.txz', '.tar.xz'),
+}
 
-    comps = arch_name.split('.')
+FILE_SUFFIXES = {
+    'CBF': ('.cbf',),
+}
 
-    if comps[-1] == 'tgz' or (comps[-2] == 'tar' and comps[-1] == 'gz'):
-        return 'TGZ'
-    
-    if comps[-1] == 'tbz' or (comps[-2] == 'tar' and comps[-1] == 'bz2'):
-        return 'TBZ'
 
-    if comps[-1] == 'zip':
-        return 'ZIP'
+def determine_arch_type(arch_name):
 
-    if comps[-1] == 'txz' or (comps[-2] == 'tar' and comps[-1] == 'xz'):
-        return 'TXZ'
+    arch_name = arch_name.lower()
+    for arch_type, suffixes in ARCH_SUFFIXES.items():
+        if arch_name.endswith(suffixes):
+            return arch_type
     
 
 def determine_file_type(file_name):
     
-    comps = file_name.split('.')
+    file_name = file_name.lower()
+    for file_type, suffixes in FILE_SUFFIXES.items():
+        if file_name.endswith(suffixes):
+            return file_type
 
-    if comps[-1] == 'cbf':
-        return 'CBF'
-    else:
-        print("WARNING: Unable to determine type of image file")
-        return '???'
+    print("WARNING: Unable to determine type of image file")
+    return '???'
 
 # ============ Output =============
 
-def cif_init(fn: Path):
+def cif_init(fn: Path, outf):
     cif_header = f"""#\\#CIF_2.0
 # CIF converted from DIALS .expt file
 # Conversion routine version 0.1
 data_{fn.stem}
 """
-    with open(fn, 'w') as outf:
-        outf.write(cif_header)
+    outf.write(cif_header)
 
 
-def write_beam_info(wl, fn):
+def write_beam_info(wl, outf):
     cif_block = f"""
 _diffrn_radiation_wavelength.id    1
 _diffrn_radiation_wavelength.value {wl}
 _diffrn_radiation.type             xray
 """
-    with open(fn, 'a') as outf:
-        outf.write(cif_block)
-
-def cif_loop(base_name: str, fields: list, rows) -> str:
-    """Assemble a loop_ table ready to be written to a CIF file"""
-    for i, row in enumerate(rows, start=1):
-        if len(row) != len(fields):
-            raise ValueError(
-                f"Row {i} has unexpected length ({len(row)} != {len(fields)}"
-            )
-    lines = ["loop_"] + [
-        f" {base_name}.{f}" for f in fields
-    ] + [""] + [
-        "  " + "\t".join([str(v) for v in r]) for r in rows
-    ] + ["", ""]
-    return "\n".join(lines)
-
-def write_axis_info(g_axes, d_axes, s_axes, fn):
+    outf.write(cif_block)
+
+def cif_loop(base_name: str, fields: list, rows, outf):
+    """Write a loop_ table to the open CIF file <outf>, one row at a time"""
+    n_fields = len(fields)
+
+    def row_lines():
+        for i, row in enumerate(rows, start=1):
+            if len(row) != n_fields:
+                raise ValueError(
+                    f"Row {i} has unexpected length ({len(row)} != {n_fields}"
+                )
+            yield "  " + "\t".join(map(str, row)) + "\n"
+
+    outf.write("loop_\n")
+    outf.writelines(f" {base_name}.{f}\n" for f in fields)
+    outf.write("\n")
+    outf.writelines(row_lines())
+    outf.write("\n")
+
+# One row of the _axis loop; all fields are kept as Python objects, so that
+# names and vector components are written exactly as they are given
+AXIS_DTYPE = np.dtype([
+    ('id', 'O'), ('next', 'O'), ('equipment', 'O'), ('type', 'O'),
+    ('vector', 'O'), ('offset', 'O')
+])
+
+def axes_table(g_axes, d_axes, s_axes):
+    """ Collect goniometer, detector and surface axes into a structured array
+        with one row per axis, in the order of the _axis loop
+    """
+
+    no_offset = (0.0, 0.0, 0.0)
+    rows = [(k, v['next'], 'goniometer', 'rotation', v['axis'], no_offset)
+            for k, v in g_axes.items()]
+    rows += [(k, v['next'], 'detector', v['type'], v['axis'], no_offset)
+             for k, v in d_axes.items()]
+    rows += [(k, v['next'], 'detector', 'translation', v['axis'], v['origin'])
+             for k, v in s_axes.items()]
+
+    return np.array(rows, dtype=AXIS_DTYPE)
+
+
+def write_axis_info(g_axes, d_axes, s_axes, outf):
     """ Write CIF syntax for all axes of the experiment, where axes
         are both from the goniometer and the detector
     """
@@ -457,62 +564,54 @@ loop_
  _axis.offset[3]
 
 """
-    with open(fn, 'a') as outf:
-        outf.write(loop_header)
+    outf.write(loop_header)
 
-        # round values
-        # tth = [round(x, digits = 6) for x in d_axes['Two_Theta']['axis']] # not used anywhere?
+    # round values
+    # tth = [round(x, digits = 6) for x in d_axes['Two_Theta']['axis']] # not used anywhere?
 
-        for k, v in g_axes.items():
-            debug('Output axis now', k)
-            outf.write(f"  {k:10}   {v['next']:10}  goniometer  rotation     {v['axis'][0]:8} {v['axis'][1]:8} {v['axis'][2]:8}")
-            outf.write("      0.0      0.0      0.0\n")
- 
-        # !!! Detector distance is currently not written - as well in the Julia reference
-        debug('Detector info', d_axes)
-        for k, v in d_axes.items():
-            debug('Output axis now', k)
-            outf.write(f"  {k:10}   {v['next']:10}  detector    {v['type']:11}  {v['axis'][0]:8} {v['axis'][1]:8} {v['axis'][2]:8}")
-            outf.write("      0.0      0.0      0.0\n")
- 
-        for k, v in s_axes.items():
-            debug('Output surface axis', k)
-            outf.write(f"  {k:10}   {v['next']:10}  detector    translation  {v['axis'][0]:8} {v['axis'][1]:8} {v['axis'][2]:8}")
-            outf.write(f" {v['origin'][0]:8} {v['origin'][1]:8} {v['origin'][2]:8}\n")
+    # !!! Detector distance is currently not written - as well in the Julia reference
+    debug('Detector info', d_axes)
 
-        outf.write('\n')
+    table = axes_table(g_axes, d_axes, s_axes)
+    row_fmt = "  {:10}   {:10}  {:10}  {:11}  {:8} {:8} {:8} {:8} {:8} {:8}\n".format
+    outf.writelines(
+        row_fmt(k, nxt, equip, a_type, *vec, *offset)
+        for k, nxt, equip, a_type, vec, offset in zip(
+            table['id'], table['next'], table['equipment'], table['type'],
+            table['vector'], table['offset'])
+    )
+
+    outf.write('\n')
 
 
-def write_array_info(det_name, n_elms, s_axes, d_axes, fn):
+def write_array_info(det_name, n_elms, s_axes, d_axes, outf):
     """ Output information about the layout of the pixels. We assume two axes,
         with the first one the fast direction, and that there is no dead space
         between pixels.
     """
 
-    with open(fn, 'a') as outf:
-
-        outf.write(f"""\
+    outf.write(f"""\
 _diffrn_detector.id        {det_name}
 _diffrn_detector.diffrn_id DIFFRN
 """)
     
-        outf.write("""
+    outf.write("""
 loop_
  _diffrn_detector_element.id
  _diffrn_detector_element.detector_id
 
 """)
-        for elm in range(n_elms):
-            outf.write(f'  ELEMENT{elm+1}    {det_name}\n')
-        outf.write('\n')
-
-        outf.write(cif_loop(
-            "_diffrn_detector_axis",
-            ["detector_id", "axis_id"],
-            [("DETECTOR", ax) for ax in d_axes]
-        ))
+    outf.writelines(f'  ELEMENT{elm}    {det_name}\n' for elm in range(1, n_elms + 1))
+    outf.write('\n')
+
+    cif_loop(
+        "_diffrn_detector_axis",
+        ["detector_id", "axis_id"],
+        [("DETECTOR", ax) for ax in d_axes],
+        outf
+    )
 
-        outf.write("""
+    outf.write("""
 loop_
  _array_structure_list_axis.axis_id
  _array_structure_list_axis.axis_set_id
@@ -521,12 +620,12 @@ loop_
 
 """)
 
-        set_no = 1
-        for axis, v in s_axes.items():
-            outf.write(f"  {axis}    {set_no}      {v['pix_size']/2}    {v['pix_size']}\n")
-            set_no += 1
+    outf.writelines(
+        f"  {axis}    {set_no}      {v['pix_size']/2}    {v['pix_size']}\n"
+        for set_no, (axis, v) in enumerate(s_axes.items(), start=1)
+    )
 
-        outf.write("""
+    outf.write("""
 loop_
  _array_structure_list.array_id
  _array_structure_list.axis_set_id
@@ -536,14 +635,14 @@ loop_
  _array_structure_list.dimension
 
 """)
-        set_no = 1
-        for axis, v in s_axes.items():
-            outf.write(f"  1            {set_no}          increasing              {v['prec']} {v['prec']} {v['num_pix']}\n")
-            set_no += 1
-        outf.write('\n')
+    outf.writelines(
+        f"  1            {set_no}          increasing              {v['prec']} {v['prec']} {v['num_pix']}\n"
+        for set_no, v in enumerate(s_axes.values(), start=1)
+    )
+    outf.write('\n')
 
 
-def write_scan_info(scan_list, g_axes, d_axes, fn):
+def write_scan_info(scan_list, g_axes, d_axes, outf):
     """ Output scan axis information 
     """
 
@@ -560,118 +659,142 @@ loop_
 
 """)
     
-    with open(fn, 'a') as outf:
+    # which row format each axis takes does not depend on the scan, and the
+    # values of each axis position are formatted once, not once per scan
+    # (a lone scan axis carries no per-position values)
+    def fmt_vals(v):
+        return np.char.mod("%7.2f", v['vals']).tolist() if 'vals' in v else None
 
-        outf.write(loop_header)
+    g_items = [(ax, f"{ax:10}", fmt_vals(v)) for ax, v in g_axes.items()]
+    trans_fmt = "  {} {} {}     0.0     0.0       .       .       .\n".format
+    rot_fmt = "  {} {}       .       .       . {}     0.0     0.0\n".format
+    d_items = [(trans_fmt if ax == "Trans" else rot_fmt, f"{ax:10}", fmt_vals(v))
+               for ax, v in d_axes.items()]
 
-        for s_ix, scan in enumerate(scan_list):
+    # rows are collected for all scans and written in one go
+    lines = [loop_header]
 
-            scan_id = f'SCAN0{s_ix+1}'
-        
-            # get axis setting information
-        
-            gi = scan['gonio_idx']
-            di = scan['det_idx']
-        
-            for ax, v in g_axes.items():
-                if ax == scan['scan_axis']:
-                    outf.write(f"  {scan_id} {ax:10}       .       .       . {scan['start']:7.2f} {scan['step']:7.2f} {scan['range']:7.2f}\n")
-                else:
-                    outf.write(f"  {scan_id} {ax:10}       .       .       . {v['vals'][gi]:7.2f}       0       0\n")
-
-            for ax, v in d_axes.items():
-                if ax == "Trans":
-                    outf.write(f"  {scan_id} {ax:10} {v['vals'][di]:7.2f}     0.0     0.0       .       .       .\n")
-                else:
-                    outf.write(f"  {scan_id} {ax:10}       .       .       . {v['vals'][di]:7.2f}     0.0     0.0\n")
-
-            outf.write('\n')
-
-def write_frame_ids(scan_list, fn):
-
-    with open(fn, 'a') as outf:
-        rows = []
-        counter = 1
-        for s_ix, scan in enumerate(scan_list, start=1):
-            end_cnt = counter + scan['num_frames'] - 1
-            rows.append((f"SCAN{s_ix:02}", f"frm{counter}", f"frm{end_cnt}", scan['num_frames']))
-            counter = end_cnt + 1
-
-        outf.write(cif_loop(
-            "_diffrn_scan",
-            ["id", "frame_id_start", "frame_id_end", "frames"],
-            rows
-        ))
-
-        rows = []
-        counter = 1
-        for s_ix, scan in enumerate(scan_list, start=1):
-            for f_ix in range(scan['num_frames']):
-                exp_time = scan['integration_time']
-                rows.append((f"frm{counter}", f"SCAN{s_ix:02}", f_ix + 1, exp_time[f_ix]))
-                counter += 1
-
-        outf.write(cif_loop(
-            "_diffrn_scan_frame",
-            ["frame_id", "scan_id", "frame_number", "integration_time"],
-            rows
-        ))
-
-
-def write_frame_images(scan_list, fn):
+    for s_ix, scan in enumerate(scan_list):
+
+        scan_id = f'SCAN0{s_ix+1}'
+    
+        # get axis setting information
+    
+        gi = scan['gonio_idx']
+        di = scan['det_idx']
+        scan_axis = scan['scan_axis']
+    
+        for ax, ax_col, vals in g_items:
+            if ax == scan_axis:
+                lines.append(f"  {scan_id} {ax_col}       .       .       . {scan['start']:7.2f} {scan['step']:7.2f} {scan['range']:7.2f}\n")
+            else:
+                lines.append(f"  {scan_id} {ax_col}       .       .       . {vals[gi]}       0       0\n")
+
+        lines.extend(fmt(scan_id, ax_col, vals[di]) for fmt, ax_col, vals in d_items)
+
+        lines.append('\n')
+
+    outf.write("".join(lines))
+
+def write_frame_ids(scan_list, outf):
+
+    # one pass over the scans collects both the per-scan rows and what is
+    # needed to expand the per-frame columns
+    scan_rows = []
+    n_frames = []
+    int_times = []
+    counter = 1
+    for s_ix, scan in enumerate(scan_list, start=1):
+        n = scan['num_frames']
+        scan_rows.append((f"SCAN{s_ix:02}", f"frm{counter}", f"frm{counter + n - 1}", n))
+        n_frames.append(n)
+        int_times.append(np.asarray(scan['integration_time'][:n], dtype=str))
+        counter += n
+
+    cif_loop(
+        "_diffrn_scan",
+        ["id", "frame_id_start", "frame_id_end", "frames"],
+        scan_rows,
+        outf
+    )
+
+    # per-frame columns, built for all scans at once
+    counters = np.arange(1, counter)
+    rows = np.column_stack((
+        np.char.add("frm", counters.astype(str)),
+        np.repeat([row[0] for row in scan_rows], n_frames),
+        np.concatenate([np.arange(1, n + 1) for n in n_frames]).astype(str),
+        np.concatenate(int_times)
+    ))
+
+    cif_loop(
+        "_diffrn_scan_frame",
+        ["frame_id", "scan_id", "frame_number", "integration_time"],
+        rows,
+        outf
+    )
+
+
+def write_frame_images(scan_list, outf):
     """ Link frames to binary images
         TODO: Match array and element names
     """
     
-    with open(fn, 'a') as outf:
-        rows = []
-        counter = 1
-        for scan in scan_list:
-            for _ in range(scan['num_frames']):
-                rows.append((f"frm{counter}", "ELEMENT", "IMAGE", counter))
-                counter += 1
-
-        outf.write(cif_loop(
-            "_diffrn_data_frame",
-            ["id", "detector_element_id", "array_id", "binary_id"],
-            rows
-        ))
+    counters = np.arange(1, sum(scan['num_frames'] for scan in scan_list) + 1)
+    binary_ids = counters.astype(str)
+    rows = np.column_stack((
+        np.char.add("frm", binary_ids),
+        np.full(len(counters), "ELEMENT"),
+        np.full(len(counters), "IMAGE"),
+        binary_ids
+    ))
+
+    cif_loop(
+        "_diffrn_data_frame",
+        ["id", "detector_element_id", "array_id", "binary_id"],
+        rows,
+        outf
+    )
     
-        # Now link images with external locations
+    # Now link images with external locations
 
-        outf.write(cif_loop(
-            "_array_data",
-            ["array_id", "binary_id", "external_data_id"],
-            [("IMAGE", i, i) for i in range(1, counter)]
-        ))
+    cif_loop(
+        "_array_data",
+        ["array_id", "binary_id", "external_data_id"],
+        np.column_stack((rows[:, 2], binary_ids, binary_ids)),
+        outf
+    )
 
 
-def write_external_locations(ext_info, scans, fn):
+def write_external_locations(ext_info, scans, outf):
     """ External locations must be of uniform type, and organised in scan order.
     """
 
-    with open(fn, 'a') as outf:
-        outf.write("""\
+    outf.write("""\
 loop_
  _array_data_external_data.id
  _array_data_external_data.format
  _array_data_external_data.uri
 """)
-        if 'arch_type' in ext_info[0]:
-            outf.write(' _array_data_external_data.archive_format\n')
-            outf.write(' _array_data_external_data.archive_path\n')
-        outf.write('\n')
-
-        counter = 1
-        for (s_ix, extf) in enumerate(ext_info):
-            for fr_ix in range(1, scans[s_ix]['num_frames'] + 1):
-                outf.write(f"  {counter}   {extf['image_type']} ")
-                location = encode_scan_step(extf['tail'], fr_ix)
-                if 'arch_type' not in extf:
-                    outf.write(f'  {location}\n')
-                else:
-                    outf.write(f"  {extf['archive']}  {extf['arch_type']}  {location}\n")
-                counter += 1
+    if 'arch_type' in ext_info[0]:
+        outf.write(' _array_data_external_data.archive_format\n')
+        outf.write(' _array_data_external_data.archive_path\n')
+    outf.write('\n')
+
+    counter = 1
+    for extf, scan in zip(ext_info, scans):
+        # everything but the id and the location is fixed for a scan
+        if 'arch_type' not in extf:
+            columns = f"   {extf['image_type']}   "
+        else:
+            columns = f"   {extf['image_type']}   {extf['archive']}  {extf['arch_type']}  "
+        n_frames = scan['num_frames']
+        ids = range(counter, counter + n_frames)
+        locations = map(scan_step_format(extf['tail']).format,
+                        range(1, n_frames + 1))
+        outf.writelines(f"  {ext_id}{columns}{location}\n"
+                        for ext_id, location in zip(ids, locations))
+        counter += n_frames
 
 
 def encode_scan_step(template, val):
@@ -680,10 +803,21 @@ def encode_scan_step(template, val):
         The resolved number will be a zero-filled integer as part of the file name.
         For instance: 01_#####.cbf --> 01_00123.cbf for frame 123
     """
-    def repl(match):
-        width = len(match[1])
-        return f"{val:0{width}}."
-    return re.sub(r"(#+)\.", repl, template)
+    return scan_step_format(template).format(val)
+
+
+@functools.lru_cache(maxsize=None)
+def scan_step_format(template):
+    """ Translate a scan template into a format string taking the step number,
+        e.g. 01_#####.cbf --> 01_{0:05}.cbf. The template is only parsed once,
+        so that resolving the name of every frame needs no regex.
+    """
+    parts = re.split(r"(#+)\.", template)
+    # even entries are literal text, odd entries the runs of `#`
+    return "".join(
+        f"{{0:0{len(part)}}}." if i % 2 else part.replace("{", "{{").replace("}", "}}")
+        for i, part in enumerate(parts)
+    )
 
 
 # ============= main ==============
@@ -727,6 +861,11 @@ def parse_commandline(argv):
         "-z", "--archive-type",
         help = "Type of overall archive, should be of type listed in imgCIF dictionary"
     )
+    ap.add_argument(
+        "--debug",
+        action = "store_true",
+        help = "Print debug information while converting"
+    )
     args = ap.parse_args(argv)
 
     return args
@@ -734,30 +873,37 @@ def parse_commandline(argv):
 def main():
 
     args = parse_commandline(sys.argv[1:])
+    logging.basicConfig(format='%(levelname)s - %(message)s',
+                        level=logging.DEBUG if args.debug else logging.WARNING)
     out_fn = args.output_file
     if not out_fn.suffix:
         out_fn = out_fn.with_suffix('.cif')
 
-    cif_init(out_fn)
+    # the CIF is assembled in memory and written out in one go at the end
+    outf = io.StringIO()
+    cif_init(out_fn, outf)
     expt = extract_raw_info(args.input_fn)
 
     wl = get_beam_info(expt)
-    write_beam_info(wl, out_fn)
+    write_beam_info(wl, outf)
 
     g_ax, d_ax, s_ax = get_axes_info(expt)
-    write_axis_info(g_ax, d_ax, s_ax, out_fn)
+    write_axis_info(g_ax, d_ax, s_ax, outf)
 
     write_array_info('DETECTOR',
                      len(expt['detector'][0]['panels']),
-                     s_ax, d_ax, out_fn)
+                     s_ax, d_ax, outf)
 
     scans = get_scan_info(expt)
-    write_scan_info(scans, g_ax, d_ax, out_fn)
-    write_frame_ids(scans, out_fn)
-    write_frame_images(scans, out_fn)
+    write_scan_info(scans, g_ax, d_ax, outf)
+    write_frame_ids(scans, outf)
+    write_frame_images(scans, outf)
 
     ext_info = gen_external_locations(scans, vars(args)) 
-    write_external_locations(ext_info, scans, out_fn)
+    write_external_locations(ext_info, scans, outf)
+
+    with open(out_fn, 'w') as f:
+        f.write(outf.getvalue())
 
 
 if __name__ == '__main__':
@@ -2,12 +2,35 @@
 the input information.
 """
 
+import functools
 import os
 import re
-from inspect import getsourcefile
 import numpy as np
 import yaml
 
+# the libyaml based loader is much faster, but not available in every install
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=None)
+def load_user_input():
+    """Load the input options from resources/user_input.yaml. The file is read
+    and parsed only once per process, the returned dictionary is shared and must
+    not be modified.
+
+    Returns:
+        dict: the input options, or None if the file could not be parsed
+    """
+
+    resources_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources')
+
+    with open(os.path.join(resources_path, 'user_input.yaml'), 'rb') as stream:
+        try:
+            return yaml.load(stream, Loader=_YAML_LOADER)
+        except yaml.YAMLError as error:
+            print(error)
+
 
 class CommandLineParser():
     """See documentation of the init method.
@@ -20,14 +43,7 @@ class CommandLineParser():
         """
 
         self.parsed = {}
-        self._resources_path = os.path.abspath(getsourcefile(lambda: 0)).replace(
-            'command_line_interfaces/parser.py', 'resources/')
-
-        with open(f"{self._resources_path}user_input.yaml", 'r') as stream:
-            try:
-                self.input_options = yaml.safe_load(stream)
-            except yaml.YAMLError as error:
-                print(error)
+        self.input_options = load_user_input()
 
         # TODO sometimes e.g. for chi a trailing space is enough to fail the regex
         self.validation_regex = {
@@ -3,12 +3,16 @@
 
 import sys
 import os
-import re
 import click
+from pathlib import Path
 import CifFile
 from imgCIF_Creator.output_creator import imgcif_creator
 from imgCIF_Creator.command_line_interfaces import parser
 
+# file name endings of the image files accepted in a directory
+IMAGE_SUFFIXES = ('.cbf', '.smv', '.img')
+# file name endings of the supported single files
+FILE_SUFFIXES = {'h5': '.h5', 'expt': '.expt'}
 
 
 def validate_filename(filename):
@@ -20,34 +24,35 @@ def validate_filename(filename):
         filename (str): the name of the folder containing the files or the filename
     """
 
-    if os.path.isdir(filename):
-        for root, dirs, files in os.walk(filename + os.sep):
-            pattern = re.compile(r'.*((?P<cbf>\.cbf)\Z|(?P<smv>\.(smv|img))\Z)')
-            matches = [pattern.match(file) for file in files]
-            matches = [match for match in matches if match is not None]
-            occurences = len(matches)
-            if occurences > 0:
-                if matches[0]["cbf"] is not None:
-                    filetype = "cbf"
-                else:
-                    filetype = "smv"
-
-                print(f'Found {occurences} {filetype} files in {root}.')
-                
+    # the path is parsed once and reused for all checks
+    path = Path(filename)
+    if path.is_dir():
+        root = filename + os.sep
+        # only the top level directory is checked, so a single scandir suffices
+        files, dirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                (dirs if entry.is_dir() else files).append(entry.name)
+
+        matches = [file for file in files if file.endswith(IMAGE_SUFFIXES)]
+        occurences = len(matches)
+        if occurences > 0:
+            if matches[0].endswith('.cbf'):
+                filetype = "cbf"
             else:
-                print(f'Could not find cbf or smv files in {root}. Subfolder(s) \
+                filetype = "smv"
+
+            print(f'Found {occurences} {filetype} files in {root}.')
+
+        else:
+            print(f'Could not find cbf or smv files in {root}. Subfolder(s) \
 {dirs} are not considered automatically.')
-                sys.exit()
-            # check only top level dir
-            break
-    elif os.path.isfile(filename):
+            sys.exit()
+    elif path.is_file():
         filetype = None
-        supported_filetypes = ['h5', 'expt']
-        regexs = [r'.*((?P<h5>\.h5)\Z)', r'.*((?P<expt>\.expt)\Z)']
-        for i, regex in enumerate(regexs):
-            match = re.match(regex, filename)
-            if match is not None:
-                filetype = supported_filetypes[i]
+        for supported_filetype, suffix in FILE_SUFFIXES.items():
+            if path.suffix == suffix:
+                filetype = supported_filetype
                 break
         if not filetype:
             print('Only h5 (NxMx) and expt (DIALS) files are supported! \
@@ -2,17 +2,27 @@
 from an expt file created with DIALS from various original input.
 """
 
-from inspect import getsourcefile
 import json
+import logging
 import numpy as np
-import os
 import re
-from scipy.spatial.transform import Rotation as R
 import sys
-import yaml
+from typing import NamedTuple
+from imgCIF_Creator.command_line_interfaces import parser
 from imgCIF_Creator.output_creator import imgcif_creator
 from . import extractor_interface, full_cbf, extractor_utils
 
+logger = logging.getLogger(__name__)
+
+
+class _ScanEntry(NamedTuple):
+    """The information about a single scan. Being a tuple it still unpacks
+    as (axes_settings, scan_details), as the other extractors provide it.
+    """
+
+    axes: dict
+    details: dict
+
 
 class Extractor(extractor_interface.ExtractorInterface):
     """See also documentation of the init method.
@@ -37,36 +47,33 @@ class Extractor(extractor_interface.ExtractorInterface):
         self._raw_dict = self._ingest_json(filename)
         #print(self._raw_dict, '\n\n')
 
-        assert(len(self._raw_dict['scan']) == len(self._raw_dict['goniometer']))
-
-        _unique_scans = {}
-        _scanax_gonio = {}
-        _wavelength = {}
-        _det_origin = {}
-        _pixel_size = {}
-        for id, scan_info in enumerate(self._raw_dict['scan']):
-            _unique_scans[f'{id+1:02d}'] = scan_info
-            _scanax_gonio[f'{id+1:02d}'] = self._raw_dict['goniometer'][id]
-            _wavelength[f'{id+1:02d}'] = self._raw_dict['beam'][id]['wavelength']
-            _det_origin[f'{id+1:02d}'] = \
-                self._raw_dict['detector'][id]['panels'][0]['origin']
-            _pixel_size[f'{id+1:02d}'] = \
-                self._raw_dict['detector'][id]['panels'][0]['pixel_size']
-
-        print(f'{len(_unique_scans.keys())} scan(s) found')
-
-        self._scan_info_expt(_unique_scans, _scanax_gonio, _wavelength,
-                                    _det_origin, _pixel_size)
-
-        self._resources_path = os.path.abspath(getsourcefile(lambda: 0)).replace(
-            'information_extractors/dials_expt.py', 'resources/')
-
-        with open(f"{self._resources_path}user_input.yaml", 'r') as stream:
-            try:
-                input_options = yaml.safe_load(stream)
-                self._facility_options = input_options['facility']['options']
-            except yaml.YAMLError as error:
-                print(error)
+        # a single pass over the scans, the entries of the other models with
+        # the same index belong to the same scan, so their counts must match;
+        # only the detector stack may hold additional entries, see
+        # _stack_detrot_axes_from_scans
+        n_scans = len(self._raw_dict['scan'])
+        n_gonio = len(self._raw_dict['goniometer'])
+        n_beam = len(self._raw_dict['beam'])
+        n_det = len(self._raw_dict['detector'])
+        if not (n_gonio == n_beam == n_scans and n_det >= n_scans):
+            raise ValueError(
+                f'Expt file: scan/goniometer/beam counts must be equal and the '
+                f'detector count at least as large, found {n_scans} scan(s), '
+                f'{n_gonio} goniometer, {n_beam} beam and {n_det} detector '
+                f'entries')
+
+        self.scan_info = {}
+        models = zip(self._raw_dict['scan'], self._raw_dict['goniometer'],
+                     self._raw_dict['beam'], self._raw_dict['detector'])
+        for id, (scan, goniometer, beam, detector) in enumerate(models):
+            self.scan_info[f'{id+1:02d}'] = self._scan_info_expt(
+                scan, goniometer, beam['wavelength'], detector['panels'][0])
+        # the keys are formatted only above, later lookups reuse this one
+        self._first_scan = next(iter(self.scan_info), None)
+
+        print(f'{len(self.scan_info)} scan(s) found')
+
+        self._facility_options = parser.load_user_input()['facility']['options']
 
     def get_scan_settings_info(self):
         """Return pre-collected data from the self._scan_info_expt() helper
@@ -79,73 +86,82 @@ class Extractor(extractor_interface.ExtractorInterface):
         return self.scan_info
         
 
-    def get_axes_position_dict(self, expt_gonio_axes, n_frames, scan_incr):
+    def get_axes_position_dict(self, expt_gonio_axes, n_frames, scan_incr,
+                               axes_names=None):
         """Re-arrange the multi-axis dictionary of the expt input (features as
         keys) to a dictionary of {name: angle} type with axes names as keys,
         for those names found - no 2theta (!), kappa 
+        The scan axis is given at the end of the scan; the input dictionary is
+        not modified. <axes_names> are the normalised names of the axes, if
+        they are already known.
         """
-        axes_settings = {}
+        if axes_names is None:
+            axes_names = self._normalise_axes_names(expt_gonio_axes['names'])
         _index = int(expt_gonio_axes['scan_axis'])
-        _axes_names  = [name.split('_')[-1].lower() for name in expt_gonio_axes['names']]
-        _axes_angles = expt_gonio_axes['angles']
+        _axes_angles = list(expt_gonio_axes['angles'])
         _axes_angles[_index] += round((n_frames - 1) * scan_incr, 10)
-        for i, name in enumerate(_axes_names):
-            axes_settings[name] = _axes_angles[i]
-        return axes_settings
+        return dict(zip(axes_names, _axes_angles))
 
-    def _scan_info_expt(self, _scan_frame_info, _scan_gonio_axes,
-                               _wavelength, _det_origin, _pixel_size):
-        """Assemble information about the scans, this is a dictionary containing
-        the starting point settings of the axes and the details of each scan.
+    @staticmethod
+    def _normalise_axes_names(names):
+        """Strip the prefix from DIALS goniometer axis names, e.g. GON_OMEGA
+        becomes omega.
+        """
+        return [name.rsplit('_', 1)[-1].lower() for name in names]
+
+    def _scan_info_expt(self, scan_frame_info, scan_gonio_axes, wavelength,
+                        panel):
+        """Assemble information about a single scan, this is a tuple containing
+        the starting point settings of the axes and the details of the scan.
 
         Args:
-            _scan_frame_info: dictionary holding (N scan) sub-dictionaries
-                              with frame info
-            _scan_gonio_axes: dictionary holding (N scan) sub-dictionaries
-                              with goniometer axes settings
-            _wavelength: photon wavelength as in 'beam' sub-dict of the input
-            _det_origin: detector origin relative to the interaction point
-                         (adding detector distance and beam center), as in
-                         'detector/panel' sub-dict of the input
-            _pixel_size: detector pixel size as in 'detector/panel' sub-dict
-        """
+            scan_frame_info: the 'scan' sub-dict of the input with frame info
+            scan_gonio_axes: the 'goniometer' sub-dict of the input with the
+                             axes settings
+            wavelength: photon wavelength as in 'beam' sub-dict of the input
+            panel: the first 'detector/panel' sub-dict of the input, providing
+                   the detector origin relative to the interaction point
+                   (adding detector distance and beam center) and pixel size
 
-        self.scan_info = {}
+        Returns:
+            _ScanEntry: (axes_settings, scan_details) dictionaries
+        """
 
-        for scan in _scan_frame_info.keys():
-            img_num_range = _scan_frame_info[scan]['image_range']
-            n_frames = img_num_range[1] - img_num_range[0] + 1
-            scan_ax_index = _scan_gonio_axes[scan]['scan_axis']
-            scan_ax_name = \
-            _scan_gonio_axes[scan]['names'][scan_ax_index].split('_')[1].lower()
-            scan_ax_start = _scan_gonio_axes[scan]['angles'][scan_ax_index]
-            osc_range = _scan_frame_info[scan]['oscillation']
-            scan_incr = osc_range[1] - osc_range[0]
-            """ DIALS produces individual exposure times for every frame;
-            we assume this is constant and take the first as global value"""
-            exposure = _scan_frame_info[scan]['exposure_time'][0]
-
-            scan_details = {"frames" : n_frames,
-                            "axis" : scan_ax_name,
-                            "incr" : scan_incr,
-                            "time" : exposure,
-                            "start" : scan_ax_start,
-                            # because of 0.1*137 = 13.700000000000001 we round
-                            "range" : round(scan_incr * n_frames, 10),
-                            "wavelength" : _wavelength[scan],
-                            "x_pixel_size" : _pixel_size[scan][0],
-                            "y_pixel_size" : _pixel_size[scan][1],
-                            "mini_header" : 'none'  # to be clarified
-                            }
-            axes_settings = self.get_axes_position_dict(_scan_gonio_axes[scan], n_frames, scan_incr)
-            axes_settings['distance'] = _det_origin[scan][2]
-            # DEBUG START
-            #print('# DEBUG INFO # ')
-            #print(axes_settings)
-            #print(scan_details)
-            # DEBUG END
-
-            self.scan_info[scan] = (axes_settings, scan_details)
+        img_num_range = scan_frame_info['image_range']
+        n_frames = img_num_range[1] - img_num_range[0] + 1
+        scan_ax_index = scan_gonio_axes['scan_axis']
+        axes_names = self._normalise_axes_names(scan_gonio_axes['names'])
+        scan_ax_name = axes_names[scan_ax_index]
+        scan_ax_start = scan_gonio_axes['angles'][scan_ax_index]
+        osc_range = scan_frame_info['oscillation']
+        scan_incr = osc_range[1] - osc_range[0]
+        """ DIALS produces individual exposure times for every frame;
+        we assume this is constant and take the first as global value"""
+        exposure = scan_frame_info['exposure_time'][0]
+        pixel_size = panel['pixel_size']
+
+        scan_details = {"frames" : n_frames,
+                        "axis" : scan_ax_name,
+                        "incr" : scan_incr,
+                        "time" : exposure,
+                        "start" : scan_ax_start,
+                        # because of 0.1*137 = 13.700000000000001 we round
+                        "range" : round(scan_incr * n_frames, 10),
+                        "wavelength" : wavelength,
+                        "x_pixel_size" : pixel_size[0],
+                        "y_pixel_size" : pixel_size[1],
+                        "mini_header" : 'none'  # to be clarified
+                        }
+        axes_settings = self.get_axes_position_dict(scan_gonio_axes, n_frames,
+                                                    scan_incr, axes_names)
+        axes_settings['distance'] = panel['origin'][2]
+        # DEBUG START
+        #print('# DEBUG INFO # ')
+        #print(axes_settings)
+        #print(scan_details)
+        # DEBUG END
+
+        return _ScanEntry(axes_settings, scan_details)
 
 
     def get_source_info(self):
@@ -174,99 +190,103 @@ class Extractor(extractor_interface.ExtractorInterface):
         return source_info
     
 
-    def _stack_gonio_axes_from_scans(self):
-        """Return a value for the dictionary 'gonio_axes_found', which is
-           a tuple of lists: ([gonio_scan_axes], [rotation_senses])
+    def _stack_scan_axes_from_scans(self):
+        """Return the values for the dictionaries 'gonio_axes_found' and
+           'det_trans_axes_found', collected in a single pass over the scans.
+           'gonio_axes_found' is a tuple of lists:
+           ([gonio_scan_axes], [rotation_senses]),
+           'det_trans_axes_found' is a tuple of lists:
+           ([tranlation_axes], [distances])
         """
         _ax_names = []
         _ax_sense = []
-        for scan in self.scan_info.keys():
-            # tuple element [1] is the 'scan_details' dictionary
-            _ax_names.append(self.scan_info[scan][1]['axis'])
+        _dist_axes = []   # the 'distance axis' ids
+        _distances = []   # the distance values
+        for entry in self.scan_info.values():
+            _ax_names.append(entry.details['axis'])
             _ax_sense.append('c')
-        return (_ax_names, _ax_sense)
-
-    """
-    get_two_theta(detector)
-
-    Work out the rotation required to make the normal to
-    the module parallel to the beam. This assumes that
-    the panel provided is perpendicular to the beam at
-    tth = 0. `detector` is a single "detector" entry.
-
-    JULIA CODE start ------------------------------------
-
-    get_two_theta(detector) = begin
-
-        pp = find_perp_panel(detector)
-
-        panel = detector["panels"][pp]
-        normal = LinearAlgebra.normalize(cross(panel["fast_axis"], panel["slow_axis"]))
-
-        @debug "Normal to surface" normal
-        if norm(normal - [0,0,1]) < 0.0001
-            return 0.0, nothing
-        end
-
-        if normal[3] > 0 #pointing towards sample 
-            normal = normal * -1.0
-        end
-
-        rb = rotation_between([0,0,-1],normal)
-        tth = rad2deg(rotation_angle(rb))
-        axis = rotation_axis(rb)
-
-        return tth, axis
-    end
-
-    JULIA CODE end ----------------------------------------
-    """
+            _dist_axes.append('trans')
+            _distances.append(entry.axes['distance'])
+        return (_ax_names, _ax_sense), (_dist_axes, _distances)
+
+    # get_two_theta(detector)
+    #
+    # Work out the rotation required to make the normal to
+    # the module parallel to the beam. This assumes that
+    # the panel provided is perpendicular to the beam at
+    # tth = 0. `detector` is a single "detector" entry.
+    #
+    # JULIA CODE start ------------------------------------
+    #
+    # get_two_theta(detector) = begin
+    #
+    #     pp = find_perp_panel(detector)
+    #
+    #     panel = detector["panels"][pp]
+    #     normal = LinearAlgebra.normalize(cross(panel["fast_axis"], panel["slow_axis"]))
+    #
+    #     @debug "Normal to surface" normal
+    #     if norm(normal - [0,0,1]) < 0.0001
+    #         return 0.0, nothing
+    #     end
+    #
+    #     if normal[3] > 0 #pointing towards sample
+    #         normal = normal * -1.0
+    #     end
+    #
+    #     rb = rotation_between([0,0,-1],normal)
+    #     tth = rad2deg(rotation_angle(rb))
+    #     axis = rotation_axis(rb)
+    #
+    #     return tth, axis
+    # end
+    #
+    # JULIA CODE end ----------------------------------------
 
     def _get_detector_panels(self):
-        """Extract the per-panel detector frame vectors (ss, fs) as in the
+        """Extract the per-panel detector frame vectors (fs, ss) as in the
            input dict (typically one such panel section per scan)
 
-           Returns: list of 2-tuples of 3-tuples, where list is over scans;
-                    outer tuple (flax, slax); inner tuple is vector (x,y,z)
+           Returns: 2-tuple (flax, slax) of arrays of shape (n, 3), with one
+                    row (x,y,z) per detector entry
         """
-        _frame_vectors = []
         det_info = self._raw_dict['detector']
-        print(f'detector stack contains {len(det_info)} entries')
-        for det in det_info:
-            fsax = tuple(det['panels'][0]['fast_axis'])
-            slax = tuple(det['panels'][0]['slow_axis'])
-            _frame_vectors.append((fsax, slax))
+        logger.debug('detector stack contains %d entries', len(det_info))
+        frame_vectors = np.array([(det['panels'][0]['fast_axis'],
+                                   det['panels'][0]['slow_axis'])
+                                  for det in det_info], dtype=float)
 
-        return _frame_vectors
+        return frame_vectors[:, 0], frame_vectors[:, 1]
 
-    def _get_two_theta(self, panel):
-        """For a given pair of detector frame axes (fast, slow) in
-           Dials expt notation, find the rotation operation from the
-           panel-normal vector to the beam vector, usually [0,0,1],
-           and return the axis-angle description of that rotation
+    def _get_two_theta(self, fsax, slax):
+        """For pairs of detector frame axes (fast, slow) in Dials expt
+           notation, find the rotation operation from the panel-normal
+           vector to the beam vector, usually [0,0,1], and return the
+           axis-angle description of that rotation. All pairs are handled
+           at once.
 
            Args:
-           - panel: a 2-tuple (fsax, slax) of 3-tuples (x,y,z)
+           - fsax, slax: arrays of shape (n, 3) with the fast and slow axes
 
-           Returns: an unpacked tuple: axis (orientiation vector), angle
+           Returns: an unpacked tuple: axes (orientiation vectors, shape (n, 3)),
+                    angles (shape (n,)); both are zero where no rotation
+                    is needed
         """
-        fsax, slax = panel
-        #print('# input DET frame axes', fsax, slax)
         p_orth = np.cross(fsax, slax)
-        #print('# plane ortho', p_orth)
-        p_norm = p_orth / np.linalg.norm(p_orth)
-        print('# plane norm', p_norm)
-        print('# delta vec', p_norm - np.array([0,0,-1]))
-        print('# norm of delta', np.linalg.norm(p_norm - np.array([0,0,-1])))
-        if np.linalg.norm(p_norm - np.array([0,0,-1])) < 0.001:
-            return (0,0,0), 0.0
-        if p_norm[2] > 0:
-            p_norm *= -1.0
-        rot_obj = R.align_vectors(np.array([0,0,-1]), p_norm)
-        rot_vec = rot_obj[0].as_rotvec(degrees=True)
-        rot_ang = np.linalg.norm(rot_vec)
-        rot_axs = rot_vec / rot_ang
-        print('# 2-theta axis', rot_axs, 'angle', rot_ang)
+        p_norm = p_orth / np.linalg.norm(p_orth, axis=1, keepdims=True)
+        logger.debug('plane norm %s', p_norm)
+        p_norm[p_norm[:, 2] > 0] *= -1.0
+        delta = np.linalg.norm(p_norm - np.array([0,0,-1]), axis=1)
+        logger.debug('norm of delta %s', delta)
+        rotated = delta >= 0.001
+        # rotation taking the normal onto the beam, in closed form
+        # (axis along the cross product, angle from its sine and cosine)
+        rot_vec = np.cross(p_norm, [0,0,-1])
+        sin_ang = np.linalg.norm(rot_vec, axis=1)
+        rot_ang = np.where(rotated, np.degrees(np.arctan2(sin_ang, -p_norm[:, 2])), 0.0)
+        rot_axs = np.divide(rot_vec, sin_ang[:, None], out=np.zeros_like(rot_vec),
+                            where=rotated[:, None])
+        logger.debug('2-theta axis %s angle %s', rot_axs, rot_ang)
         return rot_axs, rot_ang
     
     def _stack_detrot_axes_from_scans(self):
@@ -282,15 +302,10 @@ class Extractor(extractor_interface.ExtractorInterface):
         _n  = len(self.scan_info)
         # get the unique items in detector info
         panel_axes = self._get_detector_panels()
-        print(panel_axes)
+        logger.debug('panel axes %s', panel_axes)
         #exit()
         # convert panel axes to relative (plane-normal) orientation wrt. beam
-        panel_2theta_ang = []
-        panel_2theta_axs = []
-        for p in panel_axes:
-            axs, ang = self._get_two_theta(p)
-            panel_2theta_ang.append(ang)
-            panel_2theta_axs.append(axs)
+        panel_2theta_axs, panel_2theta_ang = self._get_two_theta(*panel_axes)
         # map (reduce or expand) to scans list: TODO
         scan_2theta_ang = []
         scan_2theta_axs = []
@@ -301,19 +316,6 @@ class Extractor(extractor_interface.ExtractorInterface):
         return (['detector_2theta' for _ in range(_n)], [scan_2theta_ang[_] for _ in range(_n)])
     
 
-    def _stack_det_trans_from_scans(self):
-        """Return a value for the dictionary 'det_trans_axes_found', which is
-           a simple list: [tranlation_axes]
-        """
-        _dist_axes = []   # the 'distance axis' ids
-        _distances = []   # the distance values
-        for scan in self.scan_info.keys():
-            # tuple element [0] is the 'axes_settings' dictionary
-            _dist_axes.append('trans')
-            _distances.append(self.scan_info[scan][0]['distance'])
-        return (_dist_axes, _distances)
-
-
     def get_axes_info(self):
         """Return the information about the axes settings. Cif block: _axis
 
@@ -323,16 +325,14 @@ class Extractor(extractor_interface.ExtractorInterface):
 
         print('# Entering axes info getter')
 
-        gonio_axes = self._stack_gonio_axes_from_scans()
+        gonio_axes, det_trans = self._stack_scan_axes_from_scans()
         det_rot_axes = self._stack_detrot_axes_from_scans()
-        det_trans = self._stack_det_trans_from_scans()
 
         axes_info = {'axes' : None}
         axes_info['gonio_axes_found'] = gonio_axes
         axes_info['det_rot_axes_found'] = det_rot_axes
         axes_info['det_trans_axes_found'] = det_trans
-        print('DEBUG - function "get_axes_info" return content:')
-        print(axes_info)
+        logger.debug('function "get_axes_info" return content: %s', axes_info)
         return axes_info
 
 
@@ -344,8 +344,9 @@ class Extractor(extractor_interface.ExtractorInterface):
             dict: a dictionary containing the information about the array
         """
 
-        x_px = self.scan_info['01'][1]['x_pixel_size']
-        y_px = self.scan_info['01'][1]['y_pixel_size']
+        scan_details = self.scan_info[self._first_scan].details
+        x_px = scan_details['x_pixel_size']
+        y_px = scan_details['y_pixel_size']
         array_dimension = self._raw_dict['detector'][0]['panels'][0]['image_size']
         pixel_size = [x_px, y_px]
 
@@ -395,7 +396,7 @@ class Extractor(extractor_interface.ExtractorInterface):
         print('# Entering radiation info getter')
 
         rad_type = None
-        wavelength = self.scan_info['01'][1]['wavelength']
+        wavelength = self.scan_info[self._first_scan].details['wavelength']
 
         return {'rad_type' : rad_type,
                 'wavelength' : wavelength}
@@ -431,12 +432,14 @@ class Extractor(extractor_interface.ExtractorInterface):
         """
 
         metadata_dict = {}
-        if not os.path.exists(filename):
+        try:
+            with open(filename, 'rb') as f:
+                content = f.read()
+        except OSError:
             print(f'Could not open input file {filename}! Aborting!')
             sys.exit()
-        with open(filename, 'r') as f:
-            try:
-                metadata_dict = json.load(f)
-            except json.decoder.JSONDecodeError:
-                print('Could not recognize/decode/interpret JSON format.')
+        try:
+            metadata_dict = extractor_utils.load_json(content)
+        except json.JSONDecodeError:
+            print('Could not recognize/decode/interpret JSON format.')
         return metadata_dict
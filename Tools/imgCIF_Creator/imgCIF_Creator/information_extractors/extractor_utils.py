@@ -2,10 +2,17 @@
 classes.
 """
 
+import json
 import numpy as np
-from copy import deepcopy
+from itertools import chain
 from imgCIF_Creator.output_creator import imgcif_creator
 
+try:
+    # orjson parses large JSON files several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def prune_scan_info(scan_info, prune_always_axes=False):
     """Remove reference to any axes that do not change position and are
@@ -21,30 +28,38 @@ def prune_scan_info(scan_info, prune_always_axes=False):
     """
 
     # if we want to remove always axes that are zero from the scan list it needs
-    # to be copied
-    scan_info = deepcopy(scan_info)
+    # to be copied; only the axes settings are modified, so a copy of those
+    # suffices and the scan details are shared
+    scan_info = {scan: (dict(axes_settings), details)
+                 for scan, (axes_settings, details) in scan_info.items()}
     # get the scan axes and the details from the first scan
-    first_axes_settings, details = scan_info[list(scan_info.keys())[0]]
+    first_axes_settings, details = next(iter(scan_info.values()))
     scan_axis = details["axis"]
-    keep_this = [scan_axis]
-    for axis, inital_val in first_axes_settings.items():
-        for axes_settings, _ in scan_info.values():
-            # keep axes which change their values in one of the scans
-            if axes_settings[axis] != inital_val:
-                keep_this.append(axis)
-                break
-
-    delete_later = []
-    for axis, inital_val in first_axes_settings.items():
-        condition = axis not in keep_this and np.isclose(inital_val, 0, atol=0.001)
-        if not prune_always_axes:
-            condition = condition and axis not in imgcif_creator.ALWAYS_AXES
-        if inital_val == -9999:
-            condition = True
-
-        if condition:
-            for scan in scan_info:
-                delete_later.append((scan, axis))
+    axis_names = list(first_axes_settings)
+    # one row per scan, one column per axis of the first scan; the values are
+    # compared as they are given, they need not be numeric
+    positions = np.empty((len(scan_info), len(axis_names)), dtype=object)
+    for row, (axes_settings, _) in enumerate(scan_info.values()):
+        positions[row] = [axes_settings[axis] for axis in axis_names]
+    initial_vals = positions[0]
+
+    # the always axes are protected unless they should be pruned as well
+    always_axes = frozenset() if prune_always_axes \
+        else frozenset(imgcif_creator.ALWAYS_AXES)
+
+    # keep the scan axis, the protected axes and axes which change their values
+    # in one of the scans
+    keep = np.any(positions != initial_vals, axis=0)
+    keep |= np.array([axis == scan_axis or axis in always_axes
+                      for axis in axis_names], dtype=bool)
+    # only the remaining axes are tested for zero, so only those are converted
+    prune = np.zeros(len(axis_names), dtype=bool)
+    prune[~keep] = np.isclose(initial_vals[~keep].astype(float), 0, atol=0.001)
+    # axes which are not set are always removed
+    prune |= (initial_vals == -9999).astype(bool)
+
+    delete_later = [(scan, axis) for axis, remove in zip(axis_names, prune)
+                    if remove for scan in scan_info]
 
     for scan, axis in delete_later:
         del scan_info[scan][0][axis]
@@ -53,22 +68,31 @@ def prune_scan_info(scan_info, prune_always_axes=False):
 
 
 def gen_dict_extract(query_key, input_dict):
-    """Recursive function to retrieve values of all keys matching a query
-       in a nested dictionary with possible lists of sub-dictionaries.
-       From: https://stackoverflow.com/questions/9807634/
+    """Retrieve values of all keys matching a query in a nested dictionary
+       with possible lists of sub-dictionaries. The nesting is walked with an
+       explicit stack of iterators instead of recursion, the values are
+       yielded in the same (depth-first) order.
+       Based on: https://stackoverflow.com/questions/9807634/
        find-all-occurrences-of-a-key-in-nested-dictionaries-and-lists
     """
-    if hasattr(input_dict,'items'):
-        for _key, _item in input_dict.items():
+    if not hasattr(input_dict, 'items'):
+        return
+    stack = [iter(input_dict.items())]
+    while stack:
+        for _key, _item in stack[-1]:
             if _key == query_key:
                 yield _item
             if isinstance(_item, dict):
-                for result in gen_dict_extract(query_key, _item):
-                    yield result
-            elif isinstance(_item, list):
-                for _sub_dict in _item:
-                    for result in gen_dict_extract(query_key, _sub_dict):
-                        yield result
+                stack.append(iter(_item.items()))
+                break
+            if isinstance(_item, list):
+                stack.append(chain.from_iterable(
+                    _sub_dict.items() for _sub_dict in _item
+                    if hasattr(_sub_dict, 'items')))
+                break
+        else:
+            # this level is exhausted, continue with the enclosing one
+            stack.pop()
 
 
 def name_contained(input_dict, query_key, known_options):
@@ -86,11 +110,34 @@ def name_contained(input_dict, query_key, known_options):
         option (string): the matching option for the sought info type 
     """
 
-    info_list = list(gen_dict_extract(query_key, input_dict))
-
-    for item in info_list:
+    # consume lazily, the nested dict is only walked up to the first match
+    for item in gen_dict_extract(query_key, input_dict):
         for option in known_options:
             if option in item:
                 return option
 
     return None
+
+
+def load_json(content):
+    """Parse JSON content, with orjson if it is available. orjson rejects the
+    NaN and Infinity values that json.dump writes by default, such content is
+    parsed again with json.
+
+    Args:
+        content (bytes): the JSON document
+
+    Returns:
+        the parsed content, typically a nested dictionary
+
+    Raises:
+        json.JSONDecodeError: if the content is not valid JSON
+    """
+
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+
+    return json.loads(content)
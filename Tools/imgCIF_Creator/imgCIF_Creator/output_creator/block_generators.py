@@ -72,8 +72,7 @@ class ImgCIFEntryGenerators():
             base + '.angle_range' :[],
         }
 
-        for scan in sorted(scan_info):
-            axes, dets = scan_info[scan]
+        for scan, (axes, dets) in sorted(scan_info.items()):
             for axis, val in axes.items():
                 step, scan_range = 0, 0
                 if axis == dets["axis"]:
@@ -397,8 +396,8 @@ class ImgCIFEntryGenerators():
                 the information should be written.
             detector_info (dict): information about the detector
         """
-        for dkey in detector_info.keys():
-            print(dkey, detector_info[dkey])
+        for dkey, dval in detector_info.items():
+            print(dkey, dval)
         base = "_diffrn_detector."
         cif_block[base + "id"] = detector_info["detector_id"]
         cif_block[base + "number_of_axes"] = detector_info['number_of_axes'][0]
@@ -5,6 +5,7 @@ import re
 import os
 import requests
 import importlib
+import functools
 from imgCIF_Creator.command_line_interfaces import parser
 from imgCIF_Creator.information_extractors import extractor_utils
 from . import block_generators
@@ -23,6 +24,29 @@ TRANS_AXES = ("detector_distance", "dx", "trans", "distance", 'det_z')
 ALWAYS_AXES = ("distance", "two_theta", "detector_2theta")
 
 
+@functools.lru_cache(maxsize=32)
+def _cached_extractor(module_name, filename, stem, mtime):
+    """Load the extractor module and return an extractor for the given data.
+    The result is cached, so that files which did not change (same mtime) are
+    only read once per process. Only use this for input that is a single
+    self-contained file, the mtime does not track files the input refers to.
+
+    Args:
+        module_name (str): the name of the extractor module
+        filename (str): The name of the file where the data is located.
+        stem (str): constant portion of the filenames to determine the scan
+            frame naming convention.
+        mtime (float): the modification time of filename, part of the cache key
+
+    Returns:
+        Extractor: the extractor instance of the module
+    """
+
+    extractor_module = importlib.import_module(module_name)
+
+    return extractor_module.Extractor(filename, stem)
+
+
 class ImgCIFCreator:
     """See documentation of the __init__ method.
     """
@@ -39,16 +63,22 @@ class ImgCIFCreator:
         """
 
         if filetype in ['smv', 'cbf']:
-            extractor_module = importlib.import_module(
-                'imgCIF_Creator.information_extractors.cbf_smv')
+            module_name = 'imgCIF_Creator.information_extractors.cbf_smv'
         elif filetype == 'h5':
-            extractor_module = importlib.import_module(
-                'imgCIF_Creator.information_extractors.hdf5_nxmx')
+            module_name = 'imgCIF_Creator.information_extractors.hdf5_nxmx'
         elif filetype == 'expt':
-            extractor_module = importlib.import_module(
-                'imgCIF_Creator.information_extractors.dials_expt')
-
-        self.extractor = extractor_module.Extractor(filename, stem)
+            module_name = 'imgCIF_Creator.information_extractors.dials_expt'
+
+        # batch runs may convert the same data repeatedly, the modification
+        # time in the key makes sure changed files are extracted again; this is
+        # only reliable for expt files, a directory mtime does not change when
+        # frames are rewritten and an h5 master may link to other data files
+        if filetype == 'expt':
+            self.extractor = _cached_extractor(
+                module_name, filename, stem, os.path.getmtime(filename))
+        else:
+            extractor_module = importlib.import_module(module_name)
+            self.extractor = extractor_module.Extractor(filename, stem)
         self.cmd_parser = parser.CommandLineParser()
         self.generators = block_generators.ImgCIFEntryGenerators()
 
@@ -283,11 +313,11 @@ class ImgCIFCreator:
         """
         # DEBUG start -------------------------------------
         print('Detector information pre check')
-        for dkey in detector_info.keys():
-            print(dkey, detector_info[dkey])
+        for dkey, dval in detector_info.items():
+            print(dkey, dval)
         print('Axes info pre check')
-        for dkey in axes_info.keys():
-            print(dkey, axes_info[dkey])
+        for dkey, dval in axes_info.items():
+            print(dkey, dval)
         # DEBUG end ---------------------------------------
 
         # does not include multiple detectors (yet?)
@@ -323,8 +353,8 @@ class ImgCIFCreator:
 
         # DEBUG start -------------------------------------
         print('Detector info post check')
-        for dkey in detector_info.keys():
-            print(dkey, detector_info[dkey])
+        for dkey, dval in detector_info.items():
+            print(dkey, dval)
         # DEBUG end ---------------------------------------
         return detector_info
 
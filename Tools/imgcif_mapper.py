@@ -286,7 +286,7 @@ class DLS_I04_MAP:
         tags_dict = {}
         # scan_axes = {'phi': False, 'chi': False, 'omega': False }
 
-        with h5.File(filename) as f:
+        with h5.File(filename, 'r') as f:
             for k in ['phi', 'chi', 'omega', 'fast', 'slow', 'trans']:
 
                 print('Collect INFO for', k)